@@ -25,9 +25,11 @@ __all__ = (
 )
 
 import asyncio
+import functools
 import logging
 import signal
 import sys
+import time
 import traceback
 from typing import Optional, Any, Dict, Callable, List, Tuple, Coroutine, TypeVar, Generator, Union, TYPE_CHECKING, \
     Sequence
@@ -44,6 +46,13 @@ from .iterators import GuildIterator
 from .state import ConnectionState
 from .user import ClientUser, User
 
+try:
+    import uvloop
+except ModuleNotFoundError:
+    HAS_UVLOOP = False
+else:
+    HAS_UVLOOP = True
+
 if TYPE_CHECKING:
     from .guild import GuildChannel
     from .channel import DMChannel
@@ -53,10 +62,16 @@ if TYPE_CHECKING:
 URL = r'https://api.sgroup.qq.com'
 _log = logging.getLogger(__name__)
 Coro = TypeVar('Coro', bound=Callable[..., Coroutine[Any, Any, Any]])
+# Python 3.12+ can start tasks eagerly, running them inline until their first real suspension
+_HAS_EAGER_START = sys.version_info >= (3, 12)
+# reconnect attempts that are logged while the same error keeps happening, besides every 100th
+_LOG_MILESTONES = frozenset((2, 5, 10))
+# seconds a connection has to stay up before a following error starts a new logging streak
+_HEALTHY_UPTIME = 60.0
 
 
 def _cancel_tasks(loop: asyncio.AbstractEventLoop) -> None:
-    tasks = {t for t in asyncio.all_tasks(loop=loop) if not t.done()}
+    tasks = [t for t in asyncio.all_tasks(loop=loop) if not t.done()]
 
     if not tasks:
         return
@@ -65,20 +80,41 @@ def _cancel_tasks(loop: asyncio.AbstractEventLoop) -> None:
     for task in tasks:
         task.cancel()
 
-    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    results = loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
     _log.info('所有任务都取消了。')
 
-    for task in tasks:
-        if task.cancelled():
-            continue
-        if task.exception() is not None:
+    for task, result in zip(tasks, results):
+        if isinstance(result, BaseException) and not isinstance(result, asyncio.CancelledError):
             loop.call_exception_handler({
                 'message': 'Client.run 关闭期间未处理的异常。',
-                'exception': task.exception(),
+                'exception': result,
                 'task': task
             })
 
 
+def _new_uvloop_event_loop() -> Optional[asyncio.AbstractEventLoop]:
+    # A running loop cannot be swapped out, in that case the client keeps using it
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        return None
+
+    loop = uvloop.new_event_loop()
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+def _print_event_error(event_method: str, exc: Optional[BaseException] = None) -> None:
+    # the output of the default Client.on_error, exc defaults to the exception being handled
+    print(f'忽略 {event_method} 中的异常', file=sys.stderr)
+    if exc is None:
+        traceback.print_exc()
+    else:
+        traceback.print_exception(type(exc), exc, exc.__traceback__)
+
+
 def _cleanup_loop(loop: asyncio.AbstractEventLoop) -> None:
     try:
         _cancel_tasks(loop)
@@ -102,7 +138,8 @@ class Client:
         用于异步操作的 :class:`asyncio.AbstractEventLoop` 。
         默认为 ``None`` ，在这种情况下，默认事件循环通过 :func:`asyncio.get_event_loop()` 使用。
     connector: Optional[:class:`aiohttp.BaseConnector`]
-        用于连接池的连接器。
+        用于连接池的连接器。默认为 ``None`` ，在这种情况下，客户端会创建一个 keep-alive :class:`aiohttp.TCPConnector` ，
+        它会一直复用到客户端关闭，重新连接时会创建新的连接器。如果你传入自己的连接器，请显式设置 ``keepalive_timeout`` 。
     proxy: Optional[:class:`str`]
         代理网址。
     proxy_auth: Optional[:class:`aiohttp.BasicAuth`]
@@ -119,6 +156,17 @@ class Client:
         如果处理初始数据包花费的时间太长而导致你断开连接，则很有用。默认超时为 59 秒。
     guild_ready_timeout: :class:`float`
         在准备成员缓存和触发 READY 之前等待 GUILD_CREATE 流结束的最大秒数。默认超时为 2 秒。
+    use_uvloop: :class:`bool`
+        在没有传入 ``loop`` 时，是否创建一个新的 `uvloop <https://github.com/MagicStack/uvloop>`_ 事件循环，
+        并将其设为当前事件循环。默认为 ``False`` 。如果已经有正在运行的事件循环，则会继续使用它。
+        如果没有安装 uvloop（例如在不支持它的 Windows 上），则会回退到默认的 :mod:`asyncio` 事件循环。
+    enable_debug_events: :class:`bool`
+        是否启用调试事件，例如 :func:`on_socket_raw_receive` 和 :func:`on_socket_raw_send` 。
+        启用后，事件任务也会以 ``qq.py: <事件名>`` 命名。默认为 ``False`` 。
+    eager_events: :class:`bool`
+        在 Python 3.12 及以上版本中，是否立即执行事件处理程序直到其第一次挂起，而不是等待下一次事件循环迭代。
+        默认为 ``False`` 。注意，启用后处理程序会在内部缓存（例如消息缓存）更新之前开始运行。
+        如果事件循环设置了任务工厂，则此选项无效。
 
     Attributes
     -----------
@@ -135,13 +183,22 @@ class Client:
             **options: Any,
     ):
         self.ws: QQWebSocket = None  # type: ignore
+        use_uvloop: bool = options.pop('use_uvloop', False)
+        if loop is None and use_uvloop and HAS_UVLOOP:
+            loop = _new_uvloop_event_loop()
         self.loop: asyncio.AbstractEventLoop = asyncio.get_event_loop() if loop is None else loop
-        self._listeners: Dict[str, List[Tuple[asyncio.Future, Callable[..., bool]]]] = {}
+        # per event: parallel lists of wait_for futures and their check functions
+        self._listeners: Dict[str, Tuple[List[asyncio.Future], List[Callable[..., bool]]]] = {}
         self.token = ""
         self.shard_id: Optional[int] = options.get('shard_id')
         self.shard_count: Optional[int] = options.get('shard_count')
         self._enable_debug_events: bool = options.pop('enable_debug_events', False)
+        self._eager_events: bool = options.pop('eager_events', False) and _HAS_EAGER_START
+        # refreshed on login and every (re)connect so logging configured after construction is still honoured
+        self._debug_enabled: bool = _log.isEnabledFor(logging.DEBUG)
+        self._event_cache: Dict[str, Optional[Callable[..., Coroutine[Any, Any, Any]]]] = {}
 
+        # internal handlers, these must be plain callables as ConnectionState.call_handlers calls them inline
         self._handlers: Dict[str, Callable] = {
             'ready': self._handle_ready
         }
@@ -151,7 +208,6 @@ class Client:
         }
 
         connector: Optional[aiohttp.BaseConnector] = options.pop('connector', None)
-        print(connector)
         proxy: Optional[str] = options.pop('proxy', None)
         proxy_auth: Optional[aiohttp.BasicAuth] = options.pop('proxy_auth', None)
         unsync_clock: bool = options.pop('assume_unsync_clock', True)
@@ -163,6 +219,23 @@ class Client:
         self._closed: bool = False
         self._ready: asyncio.Event = asyncio.Event()
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name[:3] == 'on_':
+            self._invalidate_event_cache(name)
+
+    def __delattr__(self, name: str) -> None:
+        super().__delattr__(name)
+        if name[:3] == 'on_':
+            self._invalidate_event_cache(name)
+
+    def _invalidate_event_cache(self, name: str) -> None:
+        # handlers can be attached by plain assignment, keep dispatch's lookup cache in sync
+        # (__dict__ is used since subclasses may assign handlers before Client.__init__ runs)
+        cache = self.__dict__.get('_event_cache')
+        if cache is not None:
+            cache.pop(name, None)
+
     def _get_websocket(self, guild_id: Optional[int] = None, *, shard_id: Optional[int] = None) -> QQWebSocket:
         return self.ws
 
@@ -190,8 +263,7 @@ class Client:
         看看 :func:`~qq.on_error` 以获取更多详细信息。
         """
 
-        print(f'忽略 {event_method} 中的异常', file=sys.stderr)
-        traceback.print_exc()
+        _print_event_error(event_method)
 
     async def _run_event(self, coro: Callable[..., Coroutine[Any, Any, Any]], event_name: str, *args: Any,
                          **kwargs: Any) -> None:
@@ -205,50 +277,89 @@ class Client:
             except asyncio.CancelledError:
                 pass
 
+    def _report_event_error(self, event_name: str, task: asyncio.Task) -> None:
+        # Same output as the default on_error, used when it has not been overridden
+        if task.cancelled():
+            return
+
+        exc = task.exception()
+        if isinstance(exc, Exception):
+            _print_event_error(event_name, exc)
+
+    def _uses_default_on_error(self) -> bool:
+        on_error = self._event_cache.get('on_error', utils.MISSING)
+        if on_error is utils.MISSING:
+            on_error = self._event_cache['on_error'] = self.on_error
+        return getattr(on_error, '__func__', None) is Client.on_error
+
+    def _create_event_task(self, wrapped: Coroutine[Any, Any, Any], event_name: str) -> asyncio.Task:
+        # Schedules the task, task names are only useful for debugging
+        name = 'qq.py: ' + event_name if self._enable_debug_events else None
+        # a task factory set on the loop by the user takes precedence over eager start
+        if self._eager_events and self.loop.get_task_factory() is None:
+            return asyncio.Task(wrapped, loop=self.loop, name=name, eager_start=True)  # type: ignore
+        return self.loop.create_task(wrapped, name=name)
+
     def _schedule_event(self, coro: Callable[..., Coroutine[Any, Any, Any]], event_name: str, *args: Any,
-                        **kwargs: Any) -> asyncio.Task:
+                        **kwargs: Any) -> Optional[asyncio.Task]:
+        if self._uses_default_on_error():
+            # No custom error handler, so skip the _run_event wrapper and report errors from a done callback
+            try:
+                # calling the handler can already fail, e.g. when its signature does not match the event
+                task = self._create_event_task(coro(*args, **kwargs), event_name)
+            except Exception:
+                _print_event_error(event_name)
+                return None
+
+            task.add_done_callback(functools.partial(self._report_event_error, event_name))
+            return task
+
         wrapped = self._run_event(coro, event_name, *args, **kwargs)
-        # Schedules the task
-        return asyncio.create_task(wrapped, name=f'qq.py: {event_name}')
+        return self._create_event_task(wrapped, event_name)
 
     def dispatch(self, event: str, *args: Any, **kwargs: Any) -> None:
-        _log.debug('分派事件 %s', event)
+        if self._debug_enabled:
+            _log.debug('分派事件 %s', event)
         method = 'on_' + event
 
         listeners = self._listeners.get(event)
-        if listeners:
-            removed = []
-            for i, (future, condition) in enumerate(listeners):
+        if listeners is not None:
+            futures, conditions = listeners
+            nargs = len(args)
+            if nargs == 0:
+                value = None
+            elif nargs == 1:
+                value = args[0]
+            else:
+                value = args
+
+            remaining_futures = []
+            remaining_conditions = []
+            for future, condition in zip(futures, conditions):
                 if future.cancelled():
-                    removed.append(i)
                     continue
 
                 try:
                     result = condition(*args)
                 except Exception as exc:
                     future.set_exception(exc)
-                    removed.append(i)
                 else:
                     if result:
-                        if len(args) == 0:
-                            future.set_result(None)
-                        elif len(args) == 1:
-                            future.set_result(args[0])
-                        else:
-                            future.set_result(args)
-                        removed.append(i)
-
-            if len(removed) == len(listeners):
-                self._listeners.pop(event)
+                        future.set_result(value)
+                    else:
+                        remaining_futures.append(future)
+                        remaining_conditions.append(condition)
+
+            if remaining_futures:
+                self._listeners[event] = (remaining_futures, remaining_conditions)
             else:
-                for idx in reversed(removed):
-                    del listeners[idx]
+                self._listeners.pop(event)
 
-        try:
-            coro = getattr(self, method)
-        except AttributeError:
-            pass
-        else:
+        coro = self._event_cache.get(method, utils.MISSING)
+        if coro is utils.MISSING:
+            coro = self._event_cache[method] = getattr(self, method, None)
+
+        if coro is not None:
             self._schedule_event(coro, method, *args, **kwargs)
 
     async def login(self, token: str) -> None:
@@ -268,8 +379,10 @@ class Client:
             发生未知的 HTTP 相关错误，通常是当它不是 200 或已知的错误。
         """
         _log.info('使用静态令牌登录')
-        self.token = token
-        data = await self.http.static_login(token.strip())
+        self._debug_enabled = _log.isEnabledFor(logging.DEBUG)
+        # normalise the token once, it is reused as-is by the HTTP client and the gateway
+        self.token = token.strip()
+        data = await self.http.static_login(self.token)
         self._connection.user = ClientUser(state=self._connection, data=data)
 
     @property
@@ -433,24 +546,27 @@ class Client:
         except NotImplementedError:
             pass
 
+        stop_loop_on_completion = True
+
         async def runner():
             try:
-                await self.start(**kwargs)
+                await self.start(*args, **kwargs)
             finally:
-                if not self.is_closed():
-                    await self.close()
-
-        def stop_loop_on_completion(f):
-            loop.stop()
+                try:
+                    if not self.is_closed():
+                        await self.close()
+                finally:
+                    # skipped once _cleanup_loop is running the loop to cancel the remaining tasks
+                    if stop_loop_on_completion:
+                        loop.stop()
 
-        future = asyncio.ensure_future(runner(), loop=loop)
-        future.add_done_callback(stop_loop_on_completion)
+        future = loop.create_task(runner())
         try:
             loop.run_forever()
         except KeyboardInterrupt:
             _log.info('接收到终止机器人和事件循环的信号。')
         finally:
-            future.remove_done_callback(stop_loop_on_completion)
+            stop_loop_on_completion = False
             _log.info('清理任务。')
             _cleanup_loop(loop)
 
@@ -508,11 +624,17 @@ class Client:
             'initial': True,
             'shard_id': self.shard_id,
         }
+        # consecutive reconnect attempts caused by the same type of error, used to throttle logging
+        attempt = 0
+        last_error: Optional[type] = None
+        connected_at: Optional[float] = None
         while not self.is_closed():
+            self._debug_enabled = _log.isEnabledFor(logging.DEBUG)
             try:
                 coro = QQWebSocket.from_client(self, **ws_params)
                 self.ws = await asyncio.wait_for(coro, timeout=60.0)
                 ws_params['initial'] = False
+                connected_at = time.monotonic()
                 while True:
                     await self.ws.poll_event()
             except ReconnectWebSocket as e:
@@ -528,9 +650,11 @@ class Client:
                     asyncio.TimeoutError) as exc:
 
                 self.dispatch('disconnect')
+                # None unless the websocket was closed with a close code
+                close_code = exc.code if isinstance(exc, ConnectionClosed) else None
                 if not reconnect:
                     await self.close()
-                    if isinstance(exc, ConnectionClosed) and exc.code == 1000:
+                    if close_code == 1000:
                         # clean close, don't re-raise this
                         return
                     raise
@@ -547,13 +671,28 @@ class Client:
                 # such as a clean disconnect (1000) or a bad state (bad token, no sharding, etc)
                 # sometimes, qq sends us 1000 for unknown reasons, so we should reconnect
                 # regardless and rely on is_closed instead
-                if isinstance(exc, ConnectionClosed):
-                    if exc.code != 1000:
-                        await self.close()
-                        raise
+                if close_code is not None and close_code != 1000:
+                    await self.close()
+                    raise
 
                 retry = backoff.delay()
-                _log.exception("尝试在 %.2fs 中重新连接", retry)
+                if connected_at is not None and time.monotonic() - connected_at >= _HEALTHY_UPTIME:
+                    # the connection was healthy for a while, so this failure starts a new streak
+                    attempt = 0
+                    last_error = None
+                connected_at = None
+
+                if type(exc) is not last_error:
+                    # only format the full traceback when the error changes
+                    attempt = 1
+                    last_error = type(exc)
+                    _log.exception("尝试在 %.2fs 中重新连接", retry)
+                else:
+                    attempt += 1
+                    if attempt in _LOG_MILESTONES or attempt % 100 == 0:
+                        _log.warning(
+                            '%s 仍在发生（第 %d 次尝试），尝试在 %.2fs 中重新连接', last_error.__name__, attempt, retry
+                        )
                 await asyncio.sleep(retry)
                 # Always try to RESUME the connection
                 # If the connection is not RESUME-able then the gateway will invalidate the session.
@@ -702,12 +841,12 @@ class Client:
 
         ev = event.lower()
         try:
-            listeners = self._listeners[ev]
+            futures, conditions = self._listeners[ev]
         except KeyError:
-            listeners = []
-            self._listeners[ev] = listeners
+            futures, conditions = self._listeners[ev] = ([], [])
 
-        listeners.append((future, check))
+        futures.append(future)
+        conditions.append(check)
         return asyncio.wait_for(future, timeout)
 
     def event(self, coro: Coro) -> Coro:
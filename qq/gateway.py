@@ -427,15 +427,13 @@ class QQWebSocket:
             _log.info('分片 ID %s 已在跟踪 %s 下成功恢复会话 %s。',
                       self.shard_id, self.session_id, ', '.join(trace))
 
-        try:
-            func = self._qq_parsers[event]
-        except KeyError:
+        func = self._qq_parsers.get(event)
+        if func is None:
             _log.debug('未知事件 %s.', event)
+        elif event == 'READY':
+            await func(data)
         else:
-            if event == 'READY':
-                await func(data)
-            else:
-                func(data)
+            func(data)
 
         # remove the dispatched listeners
         removed = []
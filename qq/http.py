@@ -202,7 +202,8 @@ class HTTPClient:
             unsync_clock: bool = True,
     ) -> None:
         self.loop: asyncio.AbstractEventLoop = asyncio.get_event_loop() if loop is None else loop
-        self.connector = connector
+        self.connector: Optional[aiohttp.BaseConnector] = connector
+        self._owns_connector: bool = connector is None
         self.__session: aiohttp.ClientSession = MISSING  # filled in static_login
         self._locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
         self._global_over: asyncio.Event = asyncio.Event()
@@ -336,7 +337,7 @@ class HTTPClient:
 
     async def static_login(self, token: str) -> user.User:
         # Necessary to get aiohttp to stop complaining about session creation
-        self.__session = aiohttp.ClientSession(connector=self.connector, ws_response_class=QQClientWebSocketResponse)
+        self.__session = self._create_session()
         old_token = self.token
         self.token = token
 
@@ -527,11 +528,16 @@ class HTTPClient:
             value = '{0}?encoding={1}&v=9'
         return data['shards'], value.format(data['url'], encoding)
 
+    def _create_session(self) -> aiohttp.ClientSession:
+        # Our keep-alive connector is shared by every session until close() closes it
+        # together with the session, recreate() then builds a fresh one
+        if self._owns_connector and (self.connector is None or self.connector.closed):
+            self.connector = aiohttp.TCPConnector(limit=100, keepalive_timeout=30, ttl_dns_cache=300)
+        return aiohttp.ClientSession(connector=self.connector, ws_response_class=QQClientWebSocketResponse)
+
     def recreate(self) -> None:
         if self.__session.closed:
-            self.__session = aiohttp.ClientSession(
-                connector=self.connector, ws_response_class=QQClientWebSocketResponse
-            )
+            self.__session = self._create_session()
 
     async def close(self) -> None:
         if self.__session:
@@ -24,12 +24,12 @@ from __future__ import annotations
 import asyncio
 import concurrent.futures
 import copy
-import inspect
 import itertools
 import logging
 import os
 from collections import deque, OrderedDict
-from typing import Callable, TYPE_CHECKING, Dict, Any, Optional, List, Union, Deque, Coroutine, TypeVar, Tuple
+from typing import Callable, ClassVar, TYPE_CHECKING, Dict, Any, Optional, List, Union, Deque, Coroutine, TypeVar, \
+    Tuple, Set
 
 from . import utils
 from .audio import AudioAction
@@ -62,7 +62,22 @@ if TYPE_CHECKING:
     Channel = Union[GuildChannel, PartialMessageable]
 
 
+# chunk request nonces only need to be unique within this process
+_NONCE_SALT: str = os.urandom(4).hex()
+_NONCE_COUNTER = itertools.count()
+
+
 class ChunkRequest:
+    __slots__ = (
+        'guild_id',
+        'resolver',
+        'loop',
+        'cache',
+        'nonce',
+        'buffer',
+        'waiters',
+    )
+
     def __init__(
             self,
             guild_id: int,
@@ -75,9 +90,9 @@ class ChunkRequest:
         self.resolver: Callable[[int], Any] = resolver
         self.loop: asyncio.AbstractEventLoop = loop
         self.cache: bool = cache
-        self.nonce: str = os.urandom(16).hex()
-        self.buffer: List[Member] = []
-        self.waiters: List[asyncio.Future[List[Member]]] = []
+        self.nonce: str = f'{_NONCE_SALT}{next(_NONCE_COUNTER):x}'
+        self.buffer: Deque[Member] = deque()
+        self.waiters: Set[asyncio.Future[List[Member]]] = set()
 
     def add_members(self, members: List[Member]) -> None:
         self.buffer.extend(members)
@@ -93,21 +108,22 @@ class ChunkRequest:
 
     async def wait(self) -> List[Member]:
         future = self.loop.create_future()
-        self.waiters.append(future)
+        self.waiters.add(future)
         try:
             return await future
         finally:
-            self.waiters.remove(future)
+            self.waiters.discard(future)
 
     def get_future(self) -> asyncio.Future[List[Member]]:
         future = self.loop.create_future()
-        self.waiters.append(future)
+        self.waiters.add(future)
         return future
 
     def done(self) -> None:
+        result = list(self.buffer)
         for future in self.waiters:
             if not future.done():
-                future.set_result(self.buffer)
+                future.set_result(result)
 
 
 _log = logging.getLogger(__name__)
@@ -126,6 +142,17 @@ class ConnectionState:
         _get_client: Callable[..., Client]
         _parsers: Dict[str, Callable[[Dict[str, Any]], None]]
 
+    # maps gateway event names to the name of their parse_* method, filled in once per class
+    _PARSER_NAMES: ClassVar[Dict[str, str]]
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._collect_parsers()
+
+    @classmethod
+    def _collect_parsers(cls) -> None:
+        cls._PARSER_NAMES = {attr[6:].upper(): attr for attr in dir(cls) if attr.startswith('parse_')}
+
     def __init__(
             self,
             *,
@@ -148,8 +175,8 @@ class ConnectionState:
         self.shard_count: Optional[int] = None
         self._ready_task: Optional[asyncio.Task] = None
         self.application_id: Optional[int] = options.get('application_id')
-        self.heartbeat_timeout: float = options.get('heartbeat_timeout', 60.0)
-        self.guild_ready_timeout: float = options.get('guild_ready_timeout', 2.0)
+        self.heartbeat_timeout: float = float(options.get('heartbeat_timeout', 60.0))
+        self.guild_ready_timeout: float = float(options.get('guild_ready_timeout', 2.0))
         self.pool = concurrent.futures.ThreadPoolExecutor()
         if self.guild_ready_timeout < 0:
             raise ValueError('guild_ready_timeout 不能为负')
@@ -184,10 +211,7 @@ class ConnectionState:
             self.store_user = self.create_user  # type: ignore
             self.deref_user = self.deref_user_no_intents  # type: ignore
 
-        self.parsers = parsers = {}
-        for attr, func in inspect.getmembers(self):
-            if attr.startswith('parse_'):
-                parsers[attr[6:].upper()] = func
+        self.parsers = {event: getattr(self, attr) for event, attr in self._PARSER_NAMES.items()}
 
         self.clear()
 
@@ -225,6 +249,7 @@ class ConnectionState:
         except KeyError:
             pass
         else:
+            # handlers such as Client._handle_ready are plain callables and run inline without allocating a task
             func(*args, **kwargs)
 
     async def call_hooks(self, key: str, *args: Any, **kwargs: Any) -> None:
@@ -794,6 +819,9 @@ class ConnectionState:
         return self.get_user(user_id)
 
 
+ConnectionState._collect_parsers()
+
+
 class AutoShardedConnectionState(ConnectionState):
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
@@ -38,6 +38,9 @@ extras_require = {
         'sphinxcontrib_trio==1.1.2',
         'sphinxcontrib-websupport',
     ],
+    'speed': [
+        'uvloop>=0.15.0; sys_platform != "win32"',
+    ],
 }
 
 setup(